@@ -5,12 +5,14 @@ This script fetches data from Garmin Connect and serves it via a simple HTTP ser
 """
 
 import os
+import hmac
 import json
 import time
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g
 from flask_cors import CORS
 import logging
+from garmin_profiler import Profiler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +21,10 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# Opt-in profiling (see GARMIN_PROFILE_* in env.example)
+profiler = Profiler.from_env()
+ADMIN_TOKEN = os.getenv('GARMIN_ADMIN_TOKEN')
+
 # Garmin Connect integration
 import random
 from datetime import datetime, timedelta
@@ -213,6 +219,9 @@ initialize_data()
 
 def refresh_data():
     """Refresh data from Garmin Connect or generate new mock data"""
+    profiler.run('refresh', 'refresh_data', _refresh_data)
+
+def _refresh_data():
     global MOCK_ACTIVITIES, MOCK_HEALTH_DATA
     
     # Try to refresh real data first
@@ -233,6 +242,53 @@ def refresh_data():
         MOCK_HEALTH_DATA = generate_mock_health_data()
         logger.info("📊 Refreshed with mock health data")
 
+@app.before_request
+def start_request_profile():
+    """Start profiling this request if a request capture is armed"""
+    if request.path != '/api/admin/profile':
+        g.profile_handle = profiler.start('requests', f"{request.method} {request.path}")
+
+@app.teardown_request
+def stop_request_profile(exc=None):
+    """Finish any profiling capture started for this request"""
+    profiler.stop(g.pop('profile_handle', None))
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def profile_endpoint():
+    """Arm profiling for the next N requests or refresh runs"""
+    if not ADMIN_TOKEN or not hmac.compare_digest(
+        request.headers.get('X-Admin-Token', '').encode(),
+        ADMIN_TOKEN.encode()
+    ):
+        return jsonify({"error": "Forbidden"}), 403
+    
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return jsonify({
+                "error": "Invalid profiling request",
+                "message": "Request body must be a JSON object"
+            }), 400
+        count = body.get('count', 1)
+        if not isinstance(count, int) or isinstance(count, bool):
+            return jsonify({
+                "error": "Invalid profiling request",
+                "message": "count must be an integer"
+            }), 400
+        try:
+            profiler.arm(
+                body.get('target', 'requests'),
+                count,
+                body.get('modes')
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                "error": "Invalid profiling request",
+                "message": str(e)
+            }), 400
+    
+    return jsonify(profiler.status())
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -312,8 +368,9 @@ def refresh_data_endpoint():
         }), 500
 
 if __name__ == '__main__':
+    host = os.environ.get('HOST', '0.0.0.0')
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
     logger.info(f"Starting Garmin Data Fetcher on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    app.run(host=host, port=port, debug=debug)
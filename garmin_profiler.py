@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Garmin Fetcher Profiler
+On-demand cProfile/tracemalloc capture for the data fetcher.
+
+A capture is armed for the next N requests or the next N refresh_data() runs,
+either at startup through environment variables or at runtime through the
+admin endpoint. While nothing is armed, run() and start() only check a counter.
+
+The .collapsed flamegraph input comes from StackSampler, which samples the
+real call stack of the profiled thread. Like any sampling profiler it is
+approximate: calls shorter than the sampling interval may not show up.
+"""
+
+import os
+import sys
+import time
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+TARGETS = ('requests', 'refresh')
+MODES = ('cpu', 'memory')
+PROFILER_FILE = os.path.basename(__file__)
+
+# Stack sampling for the .collapsed output
+SAMPLE_INTERVAL = 0.001
+MAX_COLLAPSED_STACKS = 5000
+TRUNCATED_STACK = '[other stacks]'
+
+
+def parse_modes(value):
+    """Parse a comma separated list of profiling modes"""
+    if not value:
+        return list(MODES)
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or not all(isinstance(mode, str) for mode in value):
+        raise ValueError("Profiling modes must be a string or a list of strings")
+    modes = [mode.strip().lower() for mode in value if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown or not modes:
+        raise ValueError(f"Unknown profiling mode(s): {', '.join(unknown) or 'none given'}")
+    return modes
+
+
+class StackSampler:
+    """Samples one thread's call stack from a background thread
+
+    Each sample is weighted by the wall-clock time since the previous one, so
+    the totals stay meaningful when the GIL delays sampling. At most
+    `max_stacks` distinct stacks are kept; later ones are counted under
+    TRUNCATED_STACK.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL, max_stacks=MAX_COLLAPSED_STACKS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = {}
+        self.truncated = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling"""
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _sample_loop(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            self._record(frame, now - last)
+            last = now
+
+    def _record(self, frame, seconds):
+        codes = []
+        while frame is not None:
+            code = frame.f_code
+            # The profiler's own frames are bookkeeping, not workload
+            if os.path.basename(code.co_filename) != PROFILER_FILE:
+                codes.append(code)
+            frame = frame.f_back
+        key = tuple(reversed(codes))
+        if key not in self.stacks and len(self.stacks) >= self.max_stacks:
+            self.truncated = True
+            key = TRUNCATED_STACK
+        self.stacks[key] = self.stacks.get(key, 0) + seconds
+
+    def write(self, path):
+        """Write samples in collapsed-stack format (one 'a;b;c microseconds' line per stack)"""
+        lines = []
+        for key, seconds in self.stacks.items():
+            micros = int(round(seconds * 1_000_000))
+            if micros <= 0:
+                continue
+            if key == TRUNCATED_STACK:
+                stack = TRUNCATED_STACK
+            else:
+                stack = ';'.join(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    for code in key
+                )
+            lines.append(f"{stack} {micros}\n")
+        with open(path, 'w') as f:
+            f.writelines(sorted(lines))
+
+
+class Profiler:
+    """Arms and runs profiling captures for the fetcher"""
+
+    def __init__(self, output_dir='profiles'):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        self._remaining = {target: 0 for target in TARGETS}
+        self._modes = {target: list(MODES) for target in TARGETS}
+        self._written = []
+
+    @classmethod
+    def from_env(cls):
+        """Build a profiler armed from GARMIN_PROFILE_* environment variables"""
+        output_dir = os.getenv('GARMIN_PROFILE_DIR', 'profiles')
+        profiler = cls(output_dir)
+        try:
+            modes = parse_modes(os.getenv('GARMIN_PROFILE_MODES'))
+            counts = {
+                target: int(os.getenv(f'GARMIN_PROFILE_{target.upper()}', '0') or 0)
+                for target in TARGETS
+            }
+            for target, count in counts.items():
+                if count:
+                    profiler.arm(target, count, modes)
+        except ValueError as e:
+            logger.warning(f"⚠️  Invalid GARMIN_PROFILE_* settings: {str(e)}")
+            logger.warning("Profiling stays disabled.")
+            return cls(output_dir)
+        return profiler
+
+    def arm(self, target, count, modes=None):
+        """Profile the next `count` runs of `target` ('requests' or 'refresh')"""
+        if target not in TARGETS:
+            raise ValueError(f"Unknown profiling target: {target}")
+        count = int(count)
+        if count < 0:
+            raise ValueError("Profiling count must not be negative")
+        modes = parse_modes(modes)
+        with self._lock:
+            self._remaining[target] = count
+            self._modes[target] = modes
+        logger.info(f"🔬 Profiling armed for next {count} {target} ({', '.join(modes)})")
+
+    def status(self):
+        """Current profiling budget and recently written files"""
+        with self._lock:
+            return {
+                'outputDir': os.path.abspath(self.output_dir),
+                'remaining': dict(self._remaining),
+                'modes': {target: list(modes) for target, modes in self._modes.items()},
+                'files': list(self._written[-20:]),
+            }
+
+    def _claim(self, target):
+        """Take one capture from the budget, or None if nothing is armed"""
+        if not self._remaining[target]:
+            return None
+        # Only one capture at a time: tracemalloc is process wide and
+        # overlapping cProfile sessions would fight over the profiler hook.
+        if not self._active.acquire(blocking=False):
+            return None
+        with self._lock:
+            if not self._remaining[target]:
+                self._active.release()
+                return None
+            self._remaining[target] -= 1
+            return list(self._modes[target])
+
+    def _open(self, target, name):
+        """Claim a capture and start memory tracing; the cProfile is created but not enabled
+
+        tracemalloc is process wide, so the memory delta also includes
+        allocations made by other threads while the capture is open.
+        """
+        modes = self._claim(target)
+        if modes is None:
+            return None
+
+        handle = {'target': target, 'name': name, 'modes': modes}
+        try:
+            if 'memory' in modes:
+                handle['started_tracemalloc'] = not tracemalloc.is_tracing()
+                if handle['started_tracemalloc']:
+                    tracemalloc.start(25)
+                handle['snapshot'] = tracemalloc.take_snapshot()
+            if 'cpu' in modes:
+                handle['profile'] = cProfile.Profile()
+                handle['sampler'] = StackSampler(threading.get_ident())
+        except Exception:
+            self._active.release()
+            raise
+        return handle
+
+    def _close(self, handle):
+        """Finish a capture opened with _open() and write its result files"""
+        try:
+            if 'sampler' in handle:
+                handle['sampler'].stop()
+            snapshot = None
+            if 'snapshot' in handle:
+                snapshot = tracemalloc.take_snapshot()
+                if handle['started_tracemalloc']:
+                    tracemalloc.stop()
+            return self._write(handle, handle.get('profile'), snapshot)
+        except Exception as e:
+            logger.error(f"❌ Failed to write profile for {handle['name']}: {str(e)}")
+            return []
+        finally:
+            self._active.release()
+
+    def run(self, target, name, func, *args, **kwargs):
+        """Call func(*args, **kwargs), profiling it if a capture is armed for `target`"""
+        handle = self._open(target, name)
+        if handle is None:
+            return func(*args, **kwargs)
+        try:
+            profile = handle.get('profile')
+            if profile is not None:
+                handle['sampler'].start()
+                return profile.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            self._close(handle)
+
+    def start(self, target, name):
+        """Start a capture if one is armed for `target`; returns a handle for stop()"""
+        handle = self._open(target, name)
+        if handle is not None and 'profile' in handle:
+            handle['sampler'].start()
+            handle['profile'].enable()
+        return handle
+
+    def stop(self, handle):
+        """Stop a capture started with start() and write its result files"""
+        if handle is None:
+            return []
+        if 'profile' in handle:
+            handle['profile'].disable()
+        return self._close(handle)
+
+    def _write(self, handle, profile, snapshot):
+        """Write pstats, collapsed stacks and tracemalloc reports for a capture"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() else '_' for c in handle['name']).strip('_')
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        base = os.path.join(self.output_dir, f"{handle['target']}-{safe_name}-{stamp}")
+        written = []
+
+        if profile is not None:
+            profile.dump_stats(f"{base}.pstats")
+            written.append(f"{base}.pstats")
+            sampler = handle['sampler']
+            sampler.write(f"{base}.collapsed")
+            written.append(f"{base}.collapsed")
+            if sampler.truncated:
+                logger.warning(f"⚠️  {base}.collapsed hit the {sampler.max_stacks} stack limit")
+
+        if snapshot is not None:
+            snapshot.dump(f"{base}.tracemalloc")
+            written.append(f"{base}.tracemalloc")
+            with open(f"{base}.memory.txt", 'w') as f:
+                f.write(f"Top allocations during {handle['name']} (by size delta)\n\n")
+                for stat in snapshot.compare_to(handle['snapshot'], 'lineno')[:50]:
+                    f.write(f"{stat}\n")
+            written.append(f"{base}.memory.txt")
+
+        with self._lock:
+            self._written.extend(written)
+        logger.info(f"🔬 Wrote profile for {handle['name']}: {', '.join(written)}")
+        return written
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Garmin Fetcher Load Test
+Hits the data fetcher API with concurrent clients, reports RPS and latency
+percentiles, and exits non-zero when the configured SLO thresholds are missed.
+
+By default `python garmin_fetcher.py` is started as a subprocess on a free
+127.0.0.1 port with empty credentials, so it serves the mock data source and no
+Garmin Connect account is touched. Use --url to point the run at an already
+running fetcher instead.
+
+Throughput and latency are measured over successful requests only. Whenever
+an SLO is configured the overall error rate must also stay at or below
+max_error_rate, which defaults to 0.
+
+Examples:
+    python load_test.py --concurrency 20 --duration 30
+    python load_test.py --refresh-ratio 0.2 --slo-p95 250 --min-rps 100
+    python load_test.py --slo slo.json --json results.json
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import socket
+import argparse
+import subprocess
+import threading
+import time
+import http.client
+import urllib.error
+import urllib.request
+
+ENDPOINTS = {
+    'health': ('GET', '/api/health'),
+    'activities': ('GET', '/api/garmin/activities'),
+    'garmin-health': ('GET', '/api/garmin/health'),
+    'refresh': ('POST', '/api/garmin/refresh'),
+}
+READ_ENDPOINTS = ['health', 'activities', 'garmin-health']
+FETCHER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'garmin_fetcher.py')
+
+# Threshold keys accepted in SLO files and how each is checked
+SLO_KEYS = {
+    'p50_ms': ('p50_ms', 'max'),
+    'p95_ms': ('p95_ms', 'max'),
+    'p99_ms': ('p99_ms', 'max'),
+    'min_rps': ('rps', 'min'),
+    'max_error_rate': ('error_rate', 'max'),
+}
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+# Fetcher settings that must not leak from the caller into the measured server
+SERVER_ENV_BLOCKLIST = (
+    'FLASK_ENV',
+    'GARMIN_ADMIN_TOKEN',
+    'GARMIN_PROFILE_REQUESTS',
+    'GARMIN_PROFILE_REFRESH',
+    'GARMIN_PROFILE_MODES',
+    'GARMIN_PROFILE_DIR',
+)
+
+
+def find_free_port():
+    """Ask the OS for an unused local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(log_path=os.devnull, startup_timeout=30.0):
+    """Start garmin_fetcher.py as a subprocess using the mock data source"""
+    port = find_free_port()
+    env = dict(os.environ)
+    # Debug mode or a leftover profiling setup would change the numbers
+    for name in SERVER_ENV_BLOCKLIST:
+        env.pop(name, None)
+    # Clear credentials so the fetcher never logs into Garmin Connect, and keep
+    # the throwaway server off the network
+    env.update({
+        'HOST': '127.0.0.1',
+        'PORT': str(port),
+        'GARMIN_EMAIL': '',
+        'GARMIN_PASSWORD': '',
+    })
+
+    log_file = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, FETCHER_SCRIPT],
+        cwd=os.path.dirname(FETCHER_SCRIPT),
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT
+    )
+    log_file.close()
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Fetcher exited with status {process.returncode} during startup")
+        try:
+            with urllib.request.urlopen(base_url + '/api/health', timeout=1.0) as response:
+                if response.status == 200:
+                    return process, base_url
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            pass
+        time.sleep(0.1)
+
+    stop_local_server(process)
+    raise RuntimeError(f"Fetcher did not answer /api/health within {startup_timeout:.0f}s")
+
+
+def stop_local_server(process):
+    """Terminate a fetcher started by start_local_server()"""
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    """Build RPS, error rate and latency percentiles for one set of samples
+
+    `latencies` holds successful requests only, so rps and the percentiles
+    describe successful traffic; failed requests only show up in the error rate.
+    """
+    values = sorted(latencies)
+    total = len(values) + errors
+    return {
+        'requests': total,
+        'successes': len(values),
+        'errors': errors,
+        'error_rate': errors / total if total else 0.0,
+        'rps': len(values) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': (values[-1] * 1000) if values else 0.0,
+    }
+
+
+def pick_endpoint(rng, refresh_ratio):
+    """Choose the next endpoint for the configured read/refresh mix"""
+    if rng.random() < refresh_ratio:
+        return 'refresh'
+    return rng.choice(READ_ENDPOINTS)
+
+
+def run_load(base_url, concurrency, duration=None, total_requests=None,
+             refresh_ratio=0.05, timeout=10.0, seed=None):
+    """Run the load test and return a results dict with overall and per-endpoint stats"""
+    if duration is None and total_requests is None:
+        raise ValueError("run_load needs a duration or a request count")
+    latencies = {name: [] for name in ENDPOINTS}
+    errors = {name: 0 for name in ENDPOINTS}
+    lock = threading.Lock()
+    budget = {'left': total_requests}
+    deadline = time.monotonic() + duration if duration is not None else None
+
+    def take_ticket():
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        if budget['left'] is None:
+            return True
+        with lock:
+            if budget['left'] <= 0:
+                return False
+            budget['left'] -= 1
+            return True
+
+    def worker(worker_id):
+        rng = random.Random(None if seed is None else seed + worker_id)
+        while take_ticket():
+            name = pick_endpoint(rng, refresh_ratio)
+            method, path = ENDPOINTS[name]
+            req = urllib.request.Request(
+                base_url + path,
+                method=method,
+                data=b'' if method == 'POST' else None
+            )
+            start = time.perf_counter()
+            ok = False
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, http.client.HTTPException, OSError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies[name].append(elapsed)
+                else:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'baseUrl': base_url,
+        'concurrency': concurrency,
+        'refreshRatio': refresh_ratio,
+        'elapsedSeconds': elapsed,
+        'overall': summarize(all_latencies, sum(errors.values()), elapsed),
+        'endpoints': {
+            name: summarize(latencies[name], errors[name], elapsed)
+            for name in ENDPOINTS
+            if latencies[name] or errors[name]
+        },
+    }
+
+
+def check_slos(results, slos):
+    """Return a list of SLO violation messages (empty when every threshold holds)"""
+    violations = []
+    for scope, thresholds in slos.items():
+        stats = results['overall'] if scope == 'overall' else results['endpoints'].get(scope)
+        if stats is None:
+            violations.append(f"{scope}: no requests were made to check its SLO")
+            continue
+        for key, limit in thresholds.items():
+            if key not in SLO_KEYS:
+                raise ValueError(f"Unknown SLO threshold '{key}' for {scope}")
+            metric, kind = SLO_KEYS[key]
+            if metric in LATENCY_METRICS and not stats['successes']:
+                violations.append(f"{scope}: {metric} has no successful requests to measure")
+                continue
+            value = stats[metric]
+            if (kind == 'max' and value > limit) or (kind == 'min' and value < limit):
+                bound = '<=' if kind == 'max' else '>='
+                violations.append(f"{scope}: {metric} = {value:.3f}, expected {bound} {limit}")
+    return violations
+
+
+def load_slos(args):
+    """Merge SLO thresholds from --slo file and the per-run command line flags"""
+    slos = {}
+    if args.slo:
+        with open(args.slo, 'r') as f:
+            slos = json.load(f)
+        if not isinstance(slos, dict):
+            raise ValueError("SLO file must contain a JSON object keyed by 'overall' or endpoint name")
+        unknown = [scope for scope in slos if scope != 'overall' and scope not in ENDPOINTS]
+        if unknown:
+            raise ValueError(f"Unknown SLO scope(s): {', '.join(unknown)}")
+        for scope, thresholds in slos.items():
+            if not isinstance(thresholds, dict):
+                raise ValueError(f"SLO thresholds for {scope} must be a JSON object")
+            bad_keys = [key for key in thresholds if key not in SLO_KEYS]
+            if bad_keys:
+                raise ValueError(f"Unknown SLO threshold(s) for {scope}: {', '.join(bad_keys)}")
+            for key, limit in thresholds.items():
+                if isinstance(limit, bool) or not isinstance(limit, (int, float)):
+                    raise ValueError(f"SLO threshold {scope}.{key} must be a number, got {limit!r}")
+
+    overall = dict(slos.get('overall', {}))
+    for key, value in [('p50_ms', args.slo_p50), ('p95_ms', args.slo_p95),
+                       ('p99_ms', args.slo_p99), ('min_rps', args.min_rps),
+                       ('max_error_rate', args.max_error_rate)]:
+        if value is not None:
+            overall[key] = value
+    if overall or slos:
+        # A gate that only looks at latency would pass a server answering 500s
+        overall.setdefault('max_error_rate', 0.0)
+        slos['overall'] = overall
+    return slos
+
+
+def print_report(results):
+    """Print a results table for the run"""
+    print(f"\n📊 Load test against {results['baseUrl']}")
+    print(f"   concurrency={results['concurrency']}  "
+          f"refresh ratio={results['refreshRatio']:.2f}  "
+          f"elapsed={results['elapsedSeconds']:.1f}s\n")
+    header = f"{'endpoint':<15}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = list(results['endpoints'].items()) + [('overall', results['overall'])]
+    for name, stats in rows:
+        print(f"{name:<15}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Load test the Garmin data fetcher API")
+    parser.add_argument('--url', help="Base URL of a running fetcher (default: start one locally with mock data)")
+    parser.add_argument('--server-log', default=os.devnull,
+                        help="Where the locally started fetcher writes its log output (default: discarded)")
+    parser.add_argument('--concurrency', type=int, default=10, help="Number of concurrent clients (default: 10)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Run length in seconds (default: 10)")
+    parser.add_argument('--requests', type=int, help="Stop after this many requests instead of --duration")
+    parser.add_argument('--refresh-ratio', type=float, default=0.05,
+                        help="Fraction of requests sent to /api/garmin/refresh; the rest are spread over the read endpoints (default: 0.05)")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Per-request timeout in seconds (default: 10)")
+    parser.add_argument('--seed', type=int, help="Random seed for a repeatable request mix")
+    parser.add_argument('--warmup', type=int, default=0, help="Untimed requests to send before measuring")
+    parser.add_argument('--slo', help="JSON file of thresholds keyed by 'overall' or endpoint name")
+    parser.add_argument('--slo-p50', type=float, help="Fail if overall p50 latency exceeds this many ms")
+    parser.add_argument('--slo-p95', type=float, help="Fail if overall p95 latency exceeds this many ms")
+    parser.add_argument('--slo-p99', type=float, help="Fail if overall p99 latency exceeds this many ms")
+    parser.add_argument('--min-rps', type=float, help="Fail if overall successful requests/s fall below this")
+    parser.add_argument('--max-error-rate', type=float, help="Fail if the overall error rate exceeds this fraction (default when any SLO is set: 0)")
+    parser.add_argument('--json', dest='json_path', help="Also write the results (and SLO verdict) to this JSON file")
+
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if not 0.0 <= args.refresh_ratio <= 1.0:
+        parser.error("--refresh-ratio must be between 0 and 1")
+    if args.requests is not None and args.requests < 1:
+        parser.error("--requests must be at least 1")
+    if args.duration <= 0:
+        parser.error("--duration must be greater than 0")
+    if args.warmup < 0:
+        parser.error("--warmup must not be negative")
+    if args.timeout <= 0:
+        parser.error("--timeout must be greater than 0")
+    return args
+
+
+def main(argv=None):
+    """Run the load test from the command line"""
+    args = parse_args(argv)
+
+    try:
+        slos = load_slos(args)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not load SLO thresholds: {str(e)}")
+        return 2
+
+    server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        print("🚀 Starting local fetcher with mock data...")
+        try:
+            server, base_url = start_local_server(args.server_log)
+        except (OSError, RuntimeError) as e:
+            print(f"❌ Could not start the fetcher: {str(e)}")
+            return 2
+
+    try:
+        if args.warmup:
+            print(f"🔥 Warming up with {args.warmup} requests...")
+            # A different seed so the measured run does not replay the warmup
+            warmup_seed = None if args.seed is None else args.seed + 10_000
+            run_load(base_url, args.concurrency, total_requests=args.warmup,
+                     refresh_ratio=args.refresh_ratio, timeout=args.timeout, seed=warmup_seed)
+
+        print(f"⏱️  Running load test with {args.concurrency} clients...")
+        results = run_load(
+            base_url,
+            args.concurrency,
+            duration=None if args.requests is not None else args.duration,
+            total_requests=args.requests,
+            refresh_ratio=args.refresh_ratio,
+            timeout=args.timeout,
+            seed=args.seed
+        )
+    finally:
+        if server is not None:
+            stop_local_server(server)
+
+    print_report(results)
+
+    try:
+        violations = check_slos(results, slos)
+    except ValueError as e:
+        print(f"\n❌ Invalid SLO thresholds: {str(e)}")
+        return 2
+
+    results['slos'] = slos
+    results['violations'] = violations
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json_path}")
+
+    if not slos:
+        print("\nℹ️  No SLO thresholds configured")
+        return 0
+    if violations:
+        print("\n❌ SLO check failed:")
+        for violation in violations:
+            print(f"   - {violation}")
+        return 1
+
+    print("\n✅ All SLO thresholds met")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
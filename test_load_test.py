@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Tests for the load test harness and its SLO gate.
+"""
+
+import json
+
+import pytest
+
+import load_test
+from load_test import check_slos, load_slos, parse_args, percentile, run_load, summarize
+
+# Nothing listens on port 1, so every request is refused immediately
+DEAD_URL = 'http://127.0.0.1:1'
+
+
+def results_with(overall, endpoints=None):
+    return {'overall': overall, 'endpoints': endpoints or {}}
+
+
+def write_slo_file(tmp_path, content):
+    path = tmp_path / 'slo.json'
+    path.write_text(content)
+    return str(path)
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_summarize_counts_only_successes_in_rps():
+    stats = summarize([0.01, 0.02, 0.03], errors=1, elapsed=2.0)
+    assert stats['requests'] == 4
+    assert stats['successes'] == 3
+    assert stats['rps'] == 1.5
+    assert stats['error_rate'] == 0.25
+    assert stats['p50_ms'] == pytest.approx(20.0)
+
+    failed = summarize([], errors=20, elapsed=0.01)
+    assert failed['rps'] == 0.0
+    assert failed['error_rate'] == 1.0
+
+
+def test_check_slos_passes_and_fails_on_thresholds():
+    results = results_with(summarize([0.01] * 10, errors=0, elapsed=1.0))
+    assert check_slos(results, {'overall': {'p95_ms': 50, 'min_rps': 5}}) == []
+    violations = check_slos(results, {'overall': {'p95_ms': 5, 'min_rps': 50}})
+    assert len(violations) == 2
+
+
+def test_check_slos_fails_latency_without_successes():
+    results = results_with(summarize([], errors=20, elapsed=0.01))
+    violations = check_slos(results, {'overall': {'p95_ms': 250}})
+    assert violations == ['overall: p95_ms has no successful requests to measure']
+
+
+def test_check_slos_fails_missing_endpoint():
+    results = results_with(summarize([0.01], errors=0, elapsed=1.0))
+    assert check_slos(results, {'refresh': {'p99_ms': 100}})
+
+
+def test_load_slos_defaults_error_rate_when_any_slo_is_set(tmp_path):
+    assert load_slos(parse_args([])) == {}
+    assert load_slos(parse_args(['--slo-p95', '250'])) == {
+        'overall': {'p95_ms': 250.0, 'max_error_rate': 0.0}
+    }
+    path = write_slo_file(tmp_path, '{"refresh": {"p99_ms": 1000}}')
+    assert load_slos(parse_args(['--slo', path]))['overall'] == {'max_error_rate': 0.0}
+    assert load_slos(parse_args(['--max-error-rate', '0.1']))['overall'] == {'max_error_rate': 0.1}
+
+
+@pytest.mark.parametrize('content', [
+    '[1]',
+    '{"refresh": 5}',
+    '{"overall": {"p95_ms": "fast"}}',
+    '{"overall": {"p95_ms": true}}',
+    '{"overall": {"p90_ms": 100}}',
+    '{"everything": {"p95_ms": 100}}',
+])
+def test_load_slos_rejects_bad_files(tmp_path, content):
+    path = write_slo_file(tmp_path, content)
+    with pytest.raises(ValueError):
+        load_slos(parse_args(['--slo', path]))
+
+
+@pytest.mark.parametrize('argv', [
+    ['--duration', '0'],
+    ['--duration', '-1'],
+    ['--warmup', '-1'],
+    ['--timeout', '0'],
+    ['--concurrency', '0'],
+    ['--requests', '0'],
+    ['--refresh-ratio', '1.5'],
+])
+def test_parse_args_rejects_bad_values(argv):
+    with pytest.raises(SystemExit):
+        parse_args(argv)
+
+
+def test_run_load_counts_refused_connections_as_errors():
+    results = run_load(DEAD_URL, concurrency=2, total_requests=10, timeout=1.0, seed=1)
+    assert results['overall']['requests'] == 10
+    assert results['overall']['errors'] == 10
+    assert results['overall']['rps'] == 0.0
+
+
+def test_run_load_stops_after_duration():
+    results = run_load(DEAD_URL, concurrency=2, duration=0.2, timeout=1.0)
+    assert results['elapsedSeconds'] < 2.0
+
+
+def test_run_load_needs_a_stop_condition():
+    with pytest.raises(ValueError):
+        run_load(DEAD_URL, concurrency=1)
+
+
+def test_main_fails_gate_when_every_request_errors(capsys):
+    assert load_test.main(['--url', DEAD_URL, '--requests', '20', '--slo-p95', '250']) == 1
+    assert 'SLO check failed' in capsys.readouterr().out
+
+
+def test_main_rejects_bad_slo_file_before_load(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("load should not run")
+
+    monkeypatch.setattr(load_test, 'run_load', fail)
+    path = write_slo_file(tmp_path, '{"overall": {"p95_ms": "fast"}}')
+    assert load_test.main(['--url', DEAD_URL, '--slo', path]) == 2
+
+
+def test_main_against_local_fetcher(tmp_path, monkeypatch):
+    # Leftover profiling settings must not reach the measured server
+    monkeypatch.setenv('GARMIN_PROFILE_REQUESTS', '5')
+    monkeypatch.setenv('GARMIN_PROFILE_DIR', str(tmp_path / 'profiles'))
+    out = tmp_path / 'results.json'
+    code = load_test.main([
+        '--requests', '20', '--concurrency', '2', '--refresh-ratio', '0.2',
+        '--seed', '1', '--warmup', '4', '--slo-p99', '5000', '--json', str(out)
+    ])
+    assert code == 0
+    results = json.loads(out.read_text())
+    assert results['overall']['requests'] == 20
+    assert results['overall']['errors'] == 0
+    assert results['baseUrl'].startswith('http://127.0.0.1:')
+    assert not (tmp_path / 'profiles').exists()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in fetcher profiler and its admin endpoint.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from garmin_profiler import Profiler, StackSampler, TRUNCATED_STACK, parse_modes
+
+
+def busy_work(n=2000):
+    """Small CPU-bound function to profile"""
+    return sum(i * i for i in range(n))
+
+
+def spin(seconds=0.05):
+    """Stay on the CPU long enough to be sampled"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        busy_work(200)
+    return 'done'
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return Profiler(str(tmp_path / 'profiles'))
+
+
+@pytest.fixture
+def fetcher(monkeypatch, profiler):
+    monkeypatch.setenv('GARMIN_EMAIL', '')
+    monkeypatch.setenv('GARMIN_PASSWORD', '')
+    module = importlib.import_module('garmin_fetcher')
+    monkeypatch.setattr(module, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(module, 'profiler', profiler)
+    return module
+
+
+def test_parse_modes():
+    assert parse_modes(None) == ['cpu', 'memory']
+    assert parse_modes('CPU, ') == ['cpu']
+    assert parse_modes(['memory']) == ['memory']
+    for bad in ('disk', [1], {'cpu': True}, ' , '):
+        with pytest.raises(ValueError):
+            parse_modes(bad)
+
+
+def test_arm_validates_input(profiler):
+    with pytest.raises(ValueError):
+        profiler.arm('everything', 1)
+    with pytest.raises(ValueError):
+        profiler.arm('refresh', -1)
+    assert profiler.status()['remaining'] == {'requests': 0, 'refresh': 0}
+
+
+def test_claim_uses_budget_and_allows_one_capture_at_a_time(profiler):
+    profiler.arm('refresh', 2, 'cpu')
+    profiler.arm('requests', 1, 'cpu')
+
+    assert profiler._claim('refresh') == ['cpu']
+    # A capture is still active, so nothing else is claimed or consumed
+    assert profiler._claim('requests') is None
+    assert profiler.status()['remaining'] == {'requests': 1, 'refresh': 1}
+
+    profiler._active.release()
+    assert profiler._claim('refresh') == ['cpu']
+    profiler._active.release()
+    assert profiler._claim('refresh') is None
+
+
+def test_run_without_budget_just_calls(profiler):
+    assert profiler.run('refresh', 'refresh_data', busy_work, 10) == busy_work(10)
+    assert not os.path.exists(profiler.output_dir)
+
+
+def test_run_writes_profile_files(profiler):
+    profiler.arm('refresh', 1, 'cpu,memory')
+    assert profiler.run('refresh', 'refresh_data', spin) == 'done'
+
+    files = profiler.status()['files']
+    suffixes = sorted(os.path.splitext(path)[1] for path in files)
+    assert suffixes == ['.collapsed', '.pstats', '.tracemalloc', '.txt']
+    assert profiler.status()['remaining']['refresh'] == 0
+
+    collapsed = open(next(path for path in files if path.endswith('.collapsed'))).read()
+    assert 'spin (test_profiler.py' in collapsed
+    assert 'garmin_profiler.py' not in collapsed
+
+
+def test_sampler_records_real_stacks():
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    spin()
+    sampler.stop()
+    stacks = [';'.join(code.co_name for code in key) for key in sampler.stacks]
+    assert any('spin;busy_work' in stack for stack in stacks)
+    assert 0.02 < sum(sampler.stacks.values()) < 1.0
+
+
+def test_sampler_caps_distinct_stacks(tmp_path):
+    sampler = StackSampler(threading.get_ident(), max_stacks=1)
+
+    def first():
+        sampler._record(sys._getframe(), 0.002)
+
+    def second():
+        sampler._record(sys._getframe(), 0.003)
+
+    first()
+    second()
+    second()
+    assert sampler.truncated
+    assert sampler.stacks[TRUNCATED_STACK] == pytest.approx(0.006)
+
+    out = tmp_path / 'capped.collapsed'
+    sampler.write(str(out))
+    lines = out.read_text().splitlines()
+    assert f"{TRUNCATED_STACK} 6000" in lines
+    assert any(line.endswith('first (test_profiler.py:{}) 2000'.format(first.__code__.co_firstlineno)) for line in lines)
+
+
+def test_from_env_arms_targets(monkeypatch, tmp_path):
+    monkeypatch.setenv('GARMIN_PROFILE_DIR', str(tmp_path))
+    monkeypatch.setenv('GARMIN_PROFILE_REFRESH', '3')
+    monkeypatch.setenv('GARMIN_PROFILE_MODES', 'cpu')
+    status = Profiler.from_env().status()
+    assert status['remaining'] == {'requests': 0, 'refresh': 3}
+    assert status['modes']['refresh'] == ['cpu']
+
+
+@pytest.mark.parametrize('name, value', [
+    ('GARMIN_PROFILE_REQUESTS', 'abc'),
+    ('GARMIN_PROFILE_REFRESH', '-2'),
+    ('GARMIN_PROFILE_MODES', 'disk'),
+])
+def test_from_env_ignores_bad_settings(monkeypatch, tmp_path, name, value):
+    monkeypatch.setenv('GARMIN_PROFILE_DIR', str(tmp_path))
+    monkeypatch.setenv('GARMIN_PROFILE_REQUESTS', '1')
+    monkeypatch.setenv(name, value)
+    assert Profiler.from_env().status()['remaining'] == {'requests': 0, 'refresh': 0}
+
+
+@pytest.mark.parametrize('headers', [{}, {'X-Admin-Token': 'wrong'}, {'X-Admin-Token': 'tøk'}])
+def test_admin_endpoint_requires_token(fetcher, headers):
+    client = fetcher.app.test_client()
+    assert client.get('/api/admin/profile', headers=headers).status_code == 403
+
+
+def test_admin_endpoint_disabled_without_token(fetcher, monkeypatch):
+    monkeypatch.setattr(fetcher, 'ADMIN_TOKEN', None)
+    client = fetcher.app.test_client()
+    assert client.get('/api/admin/profile', headers={'X-Admin-Token': ''}).status_code == 403
+
+
+@pytest.mark.parametrize('body', [
+    [1],
+    {'modes': [1]},
+    {'target': 'x'},
+    {'count': True},
+    {'count': '2'},
+    {'count': -1},
+])
+def test_admin_endpoint_rejects_bad_requests(fetcher, body):
+    client = fetcher.app.test_client()
+    response = client.post('/api/admin/profile', headers={'X-Admin-Token': 'secret'}, json=body)
+    assert response.status_code == 400
+
+
+def test_admin_endpoint_rejects_overflowing_count(fetcher):
+    client = fetcher.app.test_client()
+    response = client.post(
+        '/api/admin/profile',
+        headers={'X-Admin-Token': 'secret', 'Content-Type': 'application/json'},
+        data='{"count": 1e400}'
+    )
+    assert response.status_code == 400
+
+
+def test_admin_endpoint_arms_request_profiling(fetcher, profiler):
+    client = fetcher.app.test_client()
+    response = client.post(
+        '/api/admin/profile',
+        headers={'X-Admin-Token': 'secret'},
+        json={'target': 'requests', 'count': 1, 'modes': ['cpu']}
+    )
+    assert response.status_code == 200
+    assert response.get_json()['remaining']['requests'] == 1
+
+    assert client.get('/api/health').status_code == 200
+    files = profiler.status()['files']
+    assert any('GET__api_health' in path and path.endswith('.pstats') for path in files)
+    assert profiler.status()['remaining']['requests'] == 0